@@ -0,0 +1,19 @@
+"""
+Export the workflow model to ONNX Runtime for CPU hosts
+
+Run once per model before starting the app; the query processor only loads
+an existing export and falls back to transformers when there is none.
+
+    python scripts/export_onnx.py [model_name]
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "ai"))
+
+from query_processor import GISQueryProcessor  # noqa: E402
+
+
+if __name__ == "__main__":
+    processor = GISQueryProcessor(*sys.argv[1:2])
+    print("ONNX export written to", processor.export_onnx())
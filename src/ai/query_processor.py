@@ -1,11 +1,283 @@
 """
 Natural Language Query Processor for GIS Operations
 """
+import copy
+import importlib.util
+import json
+import os
+import queue
 import re
-from typing import Dict, List, Optional
-from langchain.llms import HuggingFacePipeline
+import string
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from langchain.prompts import PromptTemplate
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+
+# Must be set before torch initializes CUDA: expandable segments and a split
+# cap keep the caching allocator from fragmenting across many generate calls
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True,max_split_size_mb:512")
+
+try:
+    import hyperscan
+except ImportError:
+    # Optional multi-pattern DFA matcher; parse_query falls back to `re`
+    hyperscan = None
+
+try:
+    import ahocorasick
+except ImportError:
+    # Optional keyword automaton for the `re` fallback
+    ahocorasick = None
+
+# GIS operation patterns, all lowercase: queries are lowercased once before
+# matching instead of every scan doing case-insensitive comparisons
+PATTERNS = {
+    'spatial_operations': [
+        r'within\s+(\d+(?:\.\d+)?)\s*(km|m|miles?)',
+        r'near|close to|around',
+        r'intersect|overlap|contain',
+        r'buffer|distance'
+    ],
+    'objects': [
+        r'school[s]?', r'hospital[s]?', r'park[s]?', r'road[s]?',
+        r'building[s]?', r'river[s]?', r'forest[s]?', r'city|cities'
+    ],
+    'locations': [
+        r'mumbai', r'delhi', r'bangalore', r'chennai', r'kolkata',
+        r'india', r'district', r'state', r'village'
+    ],
+    'analysis_types': [
+        r'calculate|compute', r'identify|find', r'generate|create',
+        r'classify|categorize', r'density', r'area', r'count'
+    ]
+}
+
+DISTANCE_PATTERN = r'(\d+(?:\.\d+)?)\s*(km|m|miles?)'
+
+# Optimized graph written by ORTOptimizer and loaded on CPU hosts
+ONNX_FILE_NAME = "model_optimized.onnx"
+
+# Parsed values for queries that name no operation or analysis type
+DEFAULT_SPATIAL_OPERATION = r'near|close to|around'
+DEFAULT_ANALYSIS_TYPE = r'identify|find'
+
+# Maps each character to the ASCII letter it matches case-insensitively,
+# one character for one, so match spans in the folded query line up with
+# the original text. Besides A-Z this covers the few non-ASCII letters that
+# re.IGNORECASE also equates with ASCII ones.
+ASCII_LOWER = str.maketrans(
+    string.ascii_uppercase + '\u0130\u0131\u017f\u212a',
+    string.ascii_lowercase + 'iisk'
+)
+
+# Flattened (category, pattern) table; the position in this list is the
+# pattern id used by the scanner and also its priority within a category
+PATTERN_TABLE = [
+    (category, pattern)
+    for category, patterns in PATTERNS.items()
+    for pattern in patterns
+] + [('parameters', DISTANCE_PATTERN)]
+
+# Static instructions come first and the per-query fields last, so every
+# prompt starts with the same tokens and the engine can reuse their cached
+# KV states instead of re-attending the preamble on each request
+WORKFLOW_PROMPT_PREFIX = """Convert this GIS query into a step-by-step workflow.
+
+Generate a workflow with these steps:
+1. Data acquisition
+2. Preprocessing
+3. Spatial operations
+4. Analysis
+5. Output generation
+
+"""
+
+# Text the prefix ends with, used to tokenize the suffix in context
+PROMPT_SPLIT_ANCHOR = "\n"
+
+# Parsed query fields passed to the model as "Parsed Components"
+PROMPT_COMPONENT_FIELDS = ('target_objects', 'spatial_operation', 'location', 'analysis_type', 'parameters')
+
+WORKFLOW_PROMPT = PromptTemplate(
+    input_variables=["query", "components"],
+    template=WORKFLOW_PROMPT_PREFIX + """Query: {query}
+Parsed Components: {components}
+
+Workflow:
+"""
+)
+
+
+class SemanticWorkflowCache:
+    """Reuse generated workflows for semantically similar queries"""
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 threshold: float = 0.93, max_entries: int = 1024):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = importlib.util.find_spec('sentence_transformers') is not None
+        self._encoder = None
+        self._embeddings = None
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def get_or_generate(self, parsed_query: Dict, generate: Callable[[Dict], Dict]) -> Dict:
+        """Return a cached workflow for a similar query or generate and store one"""
+        if not self.enabled:
+            return generate(parsed_query)
+
+        try:
+            embedding = self._encode(parsed_query['original_query'])
+        except Exception as e:
+            print(f"Semantic cache disabled: {e}")
+            self.enabled = False
+            return generate(parsed_query)
+
+        key = self._key(parsed_query)
+
+        with self._lock:
+            if self._embeddings is not None:
+                # Embeddings are normalized, so the dot product is cosine similarity
+                scores = self._embeddings @ embedding
+                for index in scores.argsort()[::-1]:
+                    if scores[index] < self.threshold:
+                        break
+                    if self._entries[index][0] == key:
+                        return copy.deepcopy(self._entries[index][1])
+
+        workflow = generate(parsed_query)
+
+        import numpy as np
+
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = embedding[np.newaxis, :]
+            else:
+                self._embeddings = np.vstack([self._embeddings, embedding])
+            self._entries.append((key, copy.deepcopy(workflow)))
+
+            # Evict the oldest entries first
+            if len(self._entries) > self.max_entries:
+                self._embeddings = self._embeddings[-self.max_entries:]
+                self._entries = self._entries[-self.max_entries:]
+
+        return workflow
+
+    def _key(self, parsed_query: Dict) -> str:
+        """Parsed fields that must match exactly for a cache hit
+
+        These are the fields the prompt is built from, so e.g. the same
+        question about Mumbai and Delhi never share a workflow.
+        """
+        return repr((
+            parsed_query.get('spatial_operation'),
+            parsed_query.get('target_objects', []),
+            parsed_query.get('location', '').casefold(),
+            parsed_query.get('analysis_type'),
+            sorted(parsed_query.get('parameters', {}).items())
+        ))
+
+    def _encode(self, text: str):
+        """Embed text with the sentence-transformers model, loading it on first use"""
+        if self._encoder is None:
+            from sentence_transformers import SentenceTransformer
+            self._encoder = SentenceTransformer(self.model_name)
+        return self._encoder.encode(text, normalize_embeddings=True)
+
+
+class GenerationBatcher:
+    """Micro-batch concurrent generation requests into shared forward passes
+
+    Every backend generates through one batcher, so its worker thread is the
+    only caller of the model.
+    """
+
+    def __init__(self, generate_batch: Callable[[List[str]], List[str]],
+                 generate_stream: Optional[Callable[[str, Callable], None]] = None,
+                 max_batch: int = 8, max_wait: float = 0.01):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._generate_batch = generate_batch
+        self._generate_stream = generate_stream
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="generation-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, prompt: str) -> str:
+        """Queue one prompt and block until its completion is ready"""
+        future = Future()
+        self._queue.put((prompt, future, None))
+        return future.result()
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Queue one prompt and yield its completion text as it is generated
+
+        Streams run alone on the worker thread, between batches. Without a
+        generate_stream callable the whole completion is yielded at once.
+        """
+        if self._generate_stream is None:
+            yield self.submit(prompt)
+            return
+
+        # started receives the text iterator before generation begins,
+        # finished reports how generation ended
+        started, finished = Future(), Future()
+        self._queue.put((prompt, started, finished))
+        yield from started.result()
+        finished.result()
+
+    def _run(self):
+        """Drain up to max_batch requests every max_wait seconds and run them together"""
+        pending = None
+        while True:
+            item = pending or self._queue.get()
+            pending = None
+            if item[2] is not None:
+                self._run_stream(*item)
+                continue
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item[2] is not None:
+                    # Run the batch so far, then the stream
+                    pending = item
+                    break
+                batch.append(item)
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[Tuple]):
+        """Generate completions for a batch and resolve each caller's future"""
+        try:
+            completions = self._generate_batch([prompt for prompt, _, _ in batch])
+            # A short result would leave some callers waiting forever
+            if len(completions) != len(batch):
+                raise RuntimeError(f"Expected {len(batch)} completions, got {len(completions)}")
+            for (_, future, _), completion in zip(batch, completions):
+                future.set_result(completion)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+
+    def _run_stream(self, prompt: str, started: Future, finished: Future):
+        """Generate one streamed completion, handing its iterator to the caller"""
+        try:
+            self._generate_stream(prompt, started.set_result)
+            finished.set_result(None)
+        except Exception as e:
+            if not started.done():
+                started.set_exception(e)
+            finished.set_exception(e)
 
 
 class GISQueryProcessor:
@@ -15,69 +287,334 @@ class GISQueryProcessor:
         self.model_name = model_name
         self.tokenizer = None
         self.model = None
-        self.llm_pipeline = None
-        self._initialize_model()
+
+        # The LLM is loaded on first use of llm_pipeline, not here
+        self._llm_pipeline = None
+        self._model_loaded = False
+        self._model_lock = threading.Lock()
+        self._batcher = None
+
+        # Near-duplicate queries skip the LLM entirely
+        self._workflow_cache = SemanticWorkflowCache()
+
+        # When available, Hyperscan matches the whole table in one DFA pass
+        self._hs_db = self._build_hyperscan_db() if hyperscan else None
+        self._hs_lock = threading.Lock()
+
+        # Otherwise plain keyword patterns go through one Aho-Corasick
+        # automaton and only the rest (the numeric ones) need the regex
+        self._automaton = None
+        regex_ids = list(range(len(PATTERN_TABLE)))
+        if self._hs_db is None and ahocorasick:
+            self._automaton, regex_ids = self._build_automaton()
+
+        # Fuse the remaining patterns into one alternation so a query is
+        # scanned once. Each alternative sits in a lookahead so matches from
+        # different categories may overlap (e.g. "within 1km" and "1km").
+        self._group_ids = {f'p{i}': i for i in regex_ids}
+        self._scanner_re = re.compile(
+            '|'.join(f'(?=(?P<p{i}>{PATTERN_TABLE[i][1]}))' for i in regex_ids)
+        )
+        self._distance_re = re.compile(DISTANCE_PATTERN)
+
+    @property
+    def llm_pipeline(self):
+        """Language model pipeline, initialized on first access"""
+        if not self._model_loaded:
+            # Concurrent sessions share one processor; load the model once
+            with self._model_lock:
+                if not self._model_loaded:
+                    # GIS_DISABLE_LLM=1 forces the template workflow path
+                    if os.environ.get('GIS_DISABLE_LLM') != '1':
+                        self._initialize_model()
+                    self._model_loaded = True
+        return self._llm_pipeline
 
     def _initialize_model(self):
         """Initialize the language model"""
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_name,
-                torch_dtype="auto",
-                device_map="auto"
-            )
+            import torch
 
-            # Create pipeline
-            pipe = pipeline(
-                "text-generation",
-                model=self.model,
-                tokenizer=self.tokenizer,
-                max_new_tokens=512,
-                temperature=0.1
-            )
+            if torch.cuda.is_available() and importlib.util.find_spec('vllm'):
+                try:
+                    self._llm_pipeline = self._initialize_vllm()
+                    return
+                except Exception as e:
+                    print(f"vLLM initialization failed, using transformers: {e}")
 
-            self.llm_pipeline = HuggingFacePipeline(pipeline=pipe)
+            elif not torch.cuda.is_available() and importlib.util.find_spec('onnxruntime') \
+                    and importlib.util.find_spec('optimum'):
+                try:
+                    self._llm_pipeline = self._initialize_onnx()
+                    return
+                except Exception as e:
+                    print(f"ONNX Runtime initialization failed, using transformers: {e}")
+
+            self._llm_pipeline = self._initialize_transformers()
 
         except Exception as e:
             print(f"Error initializing model: {e}")
             # Fallback to mock processor for development
-            self.llm_pipeline = None
+            self._llm_pipeline = None
+
+    def _initialize_vllm(self):
+        """Create a vLLM engine (PagedAttention) fed by the generation batcher"""
+        from transformers import AutoConfig
+        from vllm import LLM, SamplingParams
+
+        # Share KV blocks for the common WORKFLOW_PROMPT_PREFIX. vLLM refuses
+        # prefix caching for sliding-window attention (Mistral-7B-v0.1 uses a
+        # 4096 window), so only request it when the model has none.
+        config = AutoConfig.from_pretrained(self.model_name)
+        vllm_kwargs = {}
+        if not getattr(config, 'sliding_window', None):
+            vllm_kwargs['enable_prefix_caching'] = True
+
+        self.model = LLM(model=self.model_name, tensor_parallel_size=1, **vllm_kwargs)
+        self._sampling_params = SamplingParams(max_tokens=512, temperature=0.1)
+
+        # The offline LLM is not thread-safe and only batches the prompts of
+        # a single generate call, so concurrent requests are collected by the
+        # batcher worker and passed to the engine together
+        self._batcher = GenerationBatcher(self._generate_vllm_batch)
+
+        return self._batcher.submit
+
+    def _initialize_transformers(self):
+        """Load the transformers model and return its text generation callable"""
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+        model_kwargs = {'torch_dtype': "auto", 'device_map': "auto"}
+
+        # Pre-Ampere GPUs have no native bf16, so fall back to fp16 there
+        half_dtype = None
+        if torch.cuda.is_available():
+            half_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+
+        if torch.cuda.is_available() and importlib.util.find_spec('bitsandbytes'):
+            from transformers import BitsAndBytesConfig
+
+            # 4-bit NF4 weights: decode is memory-bound, so ~4x fewer
+            # weight bytes per token translates directly into speed
+            model_kwargs['torch_dtype'] = half_dtype
+            model_kwargs['quantization_config'] = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=half_dtype
+            )
+
+        # Fused tiled attention kernel; needs half-precision activations and
+        # sm80+ (on a T4 or V100 the model loads but every generate raises)
+        if torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 8 \
+                and importlib.util.find_spec('flash_attn'):
+            model_kwargs['use_flash_attention_2'] = True
+            if model_kwargs['torch_dtype'] == "auto":
+                model_kwargs['torch_dtype'] = half_dtype
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+        self.model = AutoModelForCausalLM.from_pretrained(
+            self.model_name,
+            **model_kwargs
+        )
+
+        if torch.cuda.is_available():
+            self._reserve_cuda_memory()
+
+            # Opt-in until benchmarked: generate grows the sequence every step
+            # and the batcher varies the batch size, so shapes keep changing.
+            # bitsandbytes 4-bit layers also break the graph, so never compile
+            # the quantized model.
+            if os.environ.get('GIS_TORCH_COMPILE') == '1' and 'quantization_config' not in model_kwargs:
+                self._compile_model()
+
+        return self._prepare_generation()
+
+    def _initialize_onnx(self):
+        """Load the ONNX Runtime export of the model with fused kernels for CPU"""
+        from optimum.onnxruntime import ORTModelForCausalLM
+        from transformers import AutoTokenizer
+
+        # Exporting a 7B model takes long and can run the host out of memory,
+        # so it is an offline step (scripts/export_onnx.py), never done here
+        onnx_dir = self._onnx_dir()
+        if not os.path.isfile(os.path.join(onnx_dir, ONNX_FILE_NAME)):
+            raise FileNotFoundError(
+                f"No ONNX export in {onnx_dir}; run scripts/export_onnx.py {self.model_name}"
+            )
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+        self.model = ORTModelForCausalLM.from_pretrained(
+            onnx_dir,
+            file_name=ONNX_FILE_NAME,
+            provider="CPUExecutionProvider"
+        )
+
+        return self._prepare_generation()
+
+    def export_onnx(self) -> str:
+        """Export the model to ONNX with O3 graph fusions and return its directory"""
+        from optimum.onnxruntime import AutoOptimizationConfig, ORTModelForCausalLM, ORTOptimizer
+
+        # O3 fuses attention, MLP/GELU and LayerNorm (O4 adds fp16, GPU only)
+        onnx_dir = self._onnx_dir()
+        model = ORTModelForCausalLM.from_pretrained(self.model_name, export=True)
+        ORTOptimizer.from_pretrained(model).optimize(
+            save_dir=onnx_dir,
+            optimization_config=AutoOptimizationConfig.O3()
+        )
+        return onnx_dir
+
+    def _onnx_dir(self) -> str:
+        """Directory holding the optimized ONNX export of the model"""
+        return os.path.join(
+            os.environ.get('GIS_ONNX_CACHE_DIR', os.path.join('models', 'onnx')),
+            self.model_name.replace('/', '--')
+        )
+
+    def _prepare_generation(self):
+        """Cache the prompt prefix ids and start the batcher for the loaded model"""
+        # The static prompt prefix is tokenized once; requests only encode
+        # their own query/components suffix
+        self._prefix_ids = self.tokenizer(
+            WORKFLOW_PROMPT_PREFIX, return_tensors="pt"
+        ).input_ids.to(self.model.device)
+
+        # SentencePiece tokenizers prepend a word boundary to every input, so
+        # the suffix is encoded behind the prefix's final newline and that
+        # anchor's ids are dropped again
+        self._anchor_len = len(self.tokenizer(
+            PROMPT_SPLIT_ANCHOR, add_special_tokens=False
+        ).input_ids)
+
+        # Fall back to whole-prompt tokenization if the split still differs
+        # from what the tokenizer produces for the full prompt
+        sample = WORKFLOW_PROMPT.format(query="Find schools in Mumbai", components="{}")
+        full_ids = self.tokenizer(sample, return_tensors="pt").input_ids.to(self.model.device)
+        if not self._encode_prompt(sample).equal(full_ids):
+            print("Prompt prefix does not tokenize independently, encoding full prompts")
+            self._prefix_ids = None
+
+        # Concurrent sessions share forward passes instead of queueing on the GPU
+        self._batcher = GenerationBatcher(self._generate_batch, self._generate_stream)
+
+        return self._batcher.submit
+
+    def _encode_prompt(self, prompt: str):
+        """Token ids for a prompt, reusing the cached prefix ids when it applies"""
+        import torch
+
+        if self._prefix_ids is None or not prompt.startswith(WORKFLOW_PROMPT_PREFIX):
+            return self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.model.device)
+
+        suffix_ids = self.tokenizer(
+            PROMPT_SPLIT_ANCHOR + prompt[len(WORKFLOW_PROMPT_PREFIX):],
+            add_special_tokens=False, return_tensors="pt"
+        ).input_ids[:, self._anchor_len:].to(self.model.device)
+        return torch.cat([self._prefix_ids, suffix_ids], dim=1)
+
+    def _generate_batch(self, prompts: List[str]) -> List[str]:
+        """Run one generate call over a batch of prompts"""
+        import torch
+
+        batch = [self._encode_prompt(prompt)[0] for prompt in prompts]
+
+        # Decoder-only models continue from the last position, so prompts are
+        # left-padded to keep new tokens adjacent to each prompt
+        pad_id = self.tokenizer.eos_token_id
+        width = max(len(input_ids) for input_ids in batch)
+        padded = torch.full((len(batch), width), pad_id, dtype=batch[0].dtype, device=self.model.device)
+        attention_mask = torch.zeros_like(padded)
+        for row, input_ids in enumerate(batch):
+            padded[row, width - len(input_ids):] = input_ids
+            attention_mask[row, width - len(input_ids):] = 1
+
+        output_ids = self.model.generate(
+            input_ids=padded,
+            attention_mask=attention_mask,
+            max_new_tokens=512,
+            temperature=0.1,
+            pad_token_id=pad_id
+        )
+        return self.tokenizer.batch_decode(output_ids[:, width:], skip_special_tokens=True)
+
+    def _generate_stream(self, prompt: str, start: Callable):
+        """Generate one completion, passing a text iterator to start before decoding"""
+        from transformers import TextIteratorStreamer
+        import torch
+
+        input_ids = self._encode_prompt(prompt)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        start(streamer)
+
+        try:
+            self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=512,
+                temperature=0.1,
+                pad_token_id=self.tokenizer.eos_token_id,
+                streamer=streamer
+            )
+        except Exception:
+            # Unblock the consumer, which then sees the error
+            streamer.end()
+            raise
+
+    def _generate_vllm_batch(self, prompts: List[str]) -> List[str]:
+        """Run one vLLM generate call over a batch of prompts"""
+        # Outputs come back in prompt order
+        outputs = self.model.generate(prompts, self._sampling_params, use_tqdm=False)
+        return [output.outputs[0].text for output in outputs]
+
+    def _reserve_cuda_memory(self, fraction: float = 0.8, pool_bytes: int = 2 ** 30,
+                             block_bytes: int = 256 * 2 ** 20):
+        """Cap this process's GPU share and pre-grow the allocator pool"""
+        import torch
+
+        _, total_bytes = torch.cuda.mem_get_info()
+        allocated_bytes = torch.cuda.memory_allocated()
+        cap_bytes = fraction * total_bytes
+
+        # The model is already resident; a cap that leaves no room for
+        # activations would make every generate call run out of memory
+        if allocated_bytes + pool_bytes > cap_bytes:
+            print(f"Not capping GPU memory at {fraction:.0%}: "
+                  f"model already uses {allocated_bytes / 2 ** 30:.1f} GiB")
+            return
+
+        torch.cuda.set_per_process_memory_fraction(fraction)
+
+        # Pre-grow with blocks below max_split_size_mb (512): larger cached
+        # blocks are never split, so activations could not reuse them
+        blocks = [
+            torch.empty(block_bytes, dtype=torch.uint8, device="cuda")
+            for _ in range(pool_bytes // block_bytes)
+        ]
+        del blocks
+
+    def _compile_model(self):
+        """Compile the model forward pass and warm it up before serving"""
+        import torch
+
+        eager_forward = self.model.forward
+        try:
+            # Default mode: no CUDA graphs, which would be re-recorded for every
+            # new shape and are tied to the thread that captured them
+            self.model.forward = torch.compile(eager_forward, dynamic=True)
+
+            # Trigger compilation now rather than on the first user request
+            inputs = self.tokenizer("Warm up", return_tensors="pt").to(self.model.device)
+            self.model.generate(**inputs, max_new_tokens=8)
+        except Exception as e:
+            print(f"torch.compile failed, using eager model: {e}")
+            self.model.forward = eager_forward
 
     def parse_query(self, query: str) -> Dict:
         """Parse natural language query into structured format"""
 
-        # GIS operation patterns
-        patterns = {
-            'spatial_operations': [
-                r'within\s+(\d+(?:\.\d+)?)\s*(km|m|miles?)',
-                r'near|close to|around',
-                r'intersect|overlap|contain',
-                r'buffer|distance'
-            ],
-            'objects': [
-                r'school[s]?', r'hospital[s]?', r'park[s]?', r'road[s]?',
-                r'building[s]?', r'river[s]?', r'forest[s]?', r'city|cities'
-            ],
-            'locations': [
-                r'Mumbai', r'Delhi', r'Bangalore', r'Chennai', r'Kolkata',
-                r'India', r'district', r'state', r'village'
-            ],
-            'analysis_types': [
-                r'calculate|compute', r'identify|find', r'generate|create',
-                r'classify|categorize', r'density', r'area', r'count'
-            ]
-        }
-
-        # Extract components
-        result = {
-            'original_query': query,
-            'spatial_operation': self._extract_spatial_operation(query, patterns),
-            'target_objects': self._extract_objects(query, patterns),
-            'location': self._extract_location(query, patterns),
-            'analysis_type': self._extract_analysis_type(query, patterns),
-            'parameters': self._extract_parameters(query)
-        }
+        result = {'original_query': query}
+        result.update(self._scan(query))
 
         return result
 
@@ -85,49 +622,59 @@ class GISQueryProcessor:
         """Generate GIS workflow from parsed query"""
 
         if self.llm_pipeline:
-            return self._generate_ai_workflow(parsed_query)
+            try:
+                # A failed generation raises before the cache stores anything
+                return self._workflow_cache.get_or_generate(parsed_query, self._generate_ai_workflow)
+            except Exception as e:
+                print(f"AI workflow generation failed: {e}")
+                return self._generate_template_workflow(parsed_query)
         else:
             return self._generate_template_workflow(parsed_query)
 
-    def _generate_ai_workflow(self, parsed_query: Dict) -> Dict:
-        """Generate workflow using AI model"""
-
-        prompt_template = PromptTemplate(
-            input_variables=["query", "components"],
-            template="""
-            Convert this GIS query into a step-by-step workflow:
-
-            Query: {query}
-            Parsed Components: {components}
-
-            Generate a workflow with these steps:
-            1. Data acquisition
-            2. Preprocessing
-            3. Spatial operations
-            4. Analysis
-            5. Output generation
-
-            Workflow:
-            """
+    def stream_workflow(self, parsed_query: Dict) -> Iterator[str]:
+        """Stream the AI workflow text as it is generated
+
+        Yields nothing when no language model is available; use
+        generate_workflow for the template workflow in that case. The vLLM
+        backend yields the whole completion at once.
+        """
+        if not self.llm_pipeline:
+            return
+
+        yield from self._batcher.stream(self._build_prompt(parsed_query))
+
+    def _build_prompt(self, parsed_query: Dict) -> str:
+        """Format the workflow prompt for a parsed query"""
+        # Compact JSON of just the parsed fields keeps the per-query suffix
+        # short; the original query is already given on its own line
+        components = json.dumps(
+            {field: parsed_query[field] for field in PROMPT_COMPONENT_FIELDS},
+            separators=(',', ':'),
+            ensure_ascii=False
         )
 
-        prompt = prompt_template.format(
+        return WORKFLOW_PROMPT.format(
             query=parsed_query['original_query'],
-            components=str(parsed_query)
+            components=components
         )
 
-        try:
-            response = self.llm_pipeline(prompt)
-            return self._parse_workflow_response(response)
-        except Exception as e:
-            print(f"AI workflow generation failed: {e}")
-            return self._generate_template_workflow(parsed_query)
+    def _generate_ai_workflow(self, parsed_query: Dict) -> Dict:
+        """Generate workflow using AI model"""
+
+        prompt = self._build_prompt(parsed_query)
+        response = self.llm_pipeline(prompt)
+        return self._parse_workflow_response(response)
 
     def _generate_template_workflow(self, parsed_query: Dict) -> Dict:
         """Generate workflow using template-based approach"""
 
+        # Steps are stored column-wise: step_ids[i], actions[i], step_tools[i]
+        # and params[i] together describe step i
         workflow = {
-            'steps': [],
+            'step_ids': [],
+            'actions': [],
+            'step_tools': [],
+            'params': [],
             'tools': [],
             'data_sources': [],
             'estimated_time': '2-5 minutes'
@@ -135,98 +682,170 @@ class GISQueryProcessor:
 
         # Step 1: Data acquisition
         if 'school' in parsed_query['target_objects']:
-            workflow['steps'].append({
-                'step': 1,
-                'action': 'Acquire school location data',
-                'tool': 'OSM Overpass API',
-                'parameters': {'amenity': 'school', 'location': parsed_query['location']}
-            })
+            self._add_step(
+                workflow, 1, 'Acquire school location data', 'OSM Overpass API',
+                {'amenity': 'school', 'location': parsed_query['location']}
+            )
             workflow['data_sources'].append('OpenStreetMap')
 
         if 'hospital' in parsed_query['target_objects']:
-            workflow['steps'].append({
-                'step': 2,
-                'action': 'Acquire hospital location data',
-                'tool': 'OSM Overpass API',
-                'parameters': {'amenity': 'hospital', 'location': parsed_query['location']}
-            })
+            self._add_step(
+                workflow, 2, 'Acquire hospital location data', 'OSM Overpass API',
+                {'amenity': 'hospital', 'location': parsed_query['location']}
+            )
 
         # Step 2: Spatial operation
         if 'within' in parsed_query['spatial_operation']:
             distance = parsed_query['parameters'].get('distance', '1km')
-            workflow['steps'].append({
-                'step': 3,
-                'action': f'Create {distance} buffer around hospitals',
-                'tool': 'GeoPandas',
-                'parameters': {'distance': distance, 'unit': 'km'}
-            })
-
-            workflow['steps'].append({
-                'step': 4,
-                'action': 'Find schools within buffer zones',
-                'tool': 'PostGIS',
-                'parameters': {'operation': 'spatial_intersect'}
-            })
+            self._add_step(
+                workflow, 3, f'Create {distance} buffer around hospitals', 'GeoPandas',
+                {'distance': distance, 'unit': 'km'}
+            )
+
+            self._add_step(
+                workflow, 4, 'Find schools within buffer zones', 'PostGIS',
+                {'operation': 'spatial_intersect'}
+            )
 
         # Step 3: Analysis and output
-        workflow['steps'].append({
-            'step': 5,
-            'action': 'Generate result map and statistics',
-            'tool': 'QGIS + Folium',
-            'parameters': {'output_format': ['map', 'geojson', 'csv']}
-        })
+        self._add_step(
+            workflow, 5, 'Generate result map and statistics', 'QGIS + Folium',
+            {'output_format': ['map', 'geojson', 'csv']}
+        )
 
         workflow['tools'] = ['OSM API', 'GeoPandas', 'PostGIS', 'QGIS', 'Folium']
 
         return workflow
 
-    def _extract_spatial_operation(self, query: str, patterns: Dict) -> str:
-        """Extract spatial operation from query"""
-        for pattern in patterns['spatial_operations']:
-            if re.search(pattern, query, re.IGNORECASE):
-                return pattern
-        return 'proximity'
-
-    def _extract_objects(self, query: str, patterns: Dict) -> List[str]:
-        """Extract target objects from query"""
-        objects = []
-        for pattern in patterns['objects']:
-            if re.search(pattern, query, re.IGNORECASE):
-                objects.append(pattern.replace('[s]?', '').replace('\\', ''))
-        return objects
-
-    def _extract_location(self, query: str, patterns: Dict) -> str:
-        """Extract location from query"""
-        for pattern in patterns['locations']:
-            match = re.search(pattern, query, re.IGNORECASE)
-            if match:
-                return match.group()
-        return 'India'
-
-    def _extract_analysis_type(self, query: str, patterns: Dict) -> str:
-        """Extract analysis type from query"""
-        for pattern in patterns['analysis_types']:
-            if re.search(pattern, query, re.IGNORECASE):
-                return pattern
-        return 'find'
-
-    def _extract_parameters(self, query: str) -> Dict:
-        """Extract numerical parameters from query"""
-        params = {}
-
-        # Extract distance
-        distance_match = re.search(r'(\d+(?:\.\d+)?)\s*(km|m|miles?)', query, re.IGNORECASE)
-        if distance_match:
-            params['distance'] = distance_match.group(1)
-            params['unit'] = distance_match.group(2)
-
-        return params
+    def _add_step(self, workflow: Dict, step_id: int, action: str, tool: str, parameters: Dict):
+        """Append one step to the workflow's step columns"""
+        workflow['step_ids'].append(step_id)
+        workflow['actions'].append(action)
+        workflow['step_tools'].append(tool)
+        workflow['params'].append(parameters)
+
+    def _build_hyperscan_db(self):
+        """Compile PATTERN_TABLE into a Hyperscan block-mode database"""
+        try:
+            db = hyperscan.Database()
+            db.compile(
+                expressions=[pattern.encode() for _, pattern in PATTERN_TABLE],
+                ids=list(range(len(PATTERN_TABLE))),
+                elements=len(PATTERN_TABLE),
+                flags=hyperscan.HS_FLAG_SOM_LEFTMOST
+            )
+            return db
+        except Exception as e:
+            print(f"Hyperscan unavailable, using re: {e}")
+            return None
+
+    def _build_automaton(self):
+        """Build an Aho-Corasick automaton over the literal keyword patterns
+
+        Returns the automaton and the ids of the patterns it cannot cover.
+        """
+        automaton = ahocorasick.Automaton()
+        regex_ids = []
+
+        for pattern_id, (_, pattern) in enumerate(PATTERN_TABLE):
+            # A trailing "[s]?" never changes whether or where a keyword starts
+            keywords = pattern.replace('[s]?', '').split('|')
+            if not all(re.fullmatch(r'[a-z ]+', keyword) for keyword in keywords):
+                regex_ids.append(pattern_id)
+                continue
+            for keyword in keywords:
+                automaton.add_word(keyword, (pattern_id, len(keyword)))
+
+        automaton.make_automaton()
+        return automaton, regex_ids
+
+    def _find_hits(self, query: str) -> Dict[int, Tuple[int, int]]:
+        """Map each matched pattern id to the span of its leftmost match"""
+        hits = {}
+
+        if self._hs_db is None:
+            if self._automaton is not None:
+                # Keyword matches arrive ordered by end offset, not start
+                for last, (pattern_id, length) in self._automaton.iter(query):
+                    start = last - length + 1
+                    if pattern_id not in hits or start < hits[pattern_id][0]:
+                        hits[pattern_id] = (start, last + 1)
+
+            for match in self._scanner_re.finditer(query):
+                pattern_id = self._group_ids[match.lastgroup]
+                if pattern_id not in hits:
+                    hits[pattern_id] = match.span(match.lastgroup)
+            return hits
+
+        data = query.encode()
+
+        def on_match(pattern_id, start, end, flags, context):
+            # Matches arrive ordered by end offset, not start
+            if pattern_id not in hits or start < hits[pattern_id][0]:
+                hits[pattern_id] = (start, end)
+
+        # A database's scratch space cannot be shared by concurrent scans
+        with self._hs_lock:
+            self._hs_db.scan(data, match_event_handler=on_match)
+
+        if len(data) != len(query):
+            # Convert UTF-8 byte offsets back to str indices
+            hits = {
+                pattern_id: (len(data[:start].decode()), len(data[:end].decode()))
+                for pattern_id, (start, end) in hits.items()
+            }
+        return hits
+
+    def _scan(self, query: str) -> Dict:
+        """Extract all query components in a single pass over the query"""
+        folded = query.translate(ASCII_LOWER)
+
+        # Leftmost (start, end) of every pattern that matched
+        hits = self._find_hits(folded)
+
+        # Defaults are the patterns they stand for, so e.g. "schools in
+        # Mumbai" and "find schools near Mumbai" parse the same
+        components = {
+            'spatial_operation': DEFAULT_SPATIAL_OPERATION,
+            'target_objects': [],
+            'location': 'India',
+            'analysis_type': DEFAULT_ANALYSIS_TYPE,
+            'parameters': {}
+        }
+        found = set()
+
+        # Lower pattern ids win within a category, as in PATTERNS order
+        for pattern_id in sorted(hits):
+            category, pattern = PATTERN_TABLE[pattern_id]
+            start, end = hits[pattern_id]
+
+            if category == 'objects':
+                components['target_objects'].append(pattern.replace('[s]?', '').replace('\\', ''))
+                continue
+            if category in found:
+                continue
+            found.add(category)
+
+            if category == 'spatial_operations':
+                components['spatial_operation'] = pattern
+            elif category == 'locations':
+                components['location'] = query[start:end]
+            elif category == 'analysis_types':
+                components['analysis_type'] = pattern
+            elif category == 'parameters':
+                distance_match = self._distance_re.match(folded, start)
+                components['parameters'] = {
+                    'distance': distance_match.group(1),
+                    'unit': distance_match.group(2)
+                }
+
+        return components
 
     def _parse_workflow_response(self, response: str) -> Dict:
         """Parse AI model response into structured workflow"""
         # Implementation for parsing AI response
         # This would parse the model's text output into structured format
-        return {'steps': [], 'tools': [], 'data_sources': []}
+        return {'step_ids': [], 'actions': [], 'step_tools': [], 'params': [], 'tools': [], 'data_sources': []}
 
 
 # Example usage
@@ -3,13 +3,14 @@ Streamlit Frontend for GeoSpatial AI Assistant
 """
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
+import hashlib
+from collections import deque
+from itertools import islice
 from typing import Dict, List
-import folium
-from streamlit_folium import st_folium
-import pandas as pd
-import plotly.express as px
 
 # Page configuration
 st.set_page_config(
@@ -22,9 +23,45 @@ st.set_page_config(
 # API Configuration
 API_BASE_URL = "http://localhost:8000"
 
+# Seconds between execution status checks
+STATUS_POLL_INTERVAL = 2
+
+# Queries remembered per session for the history sidebar
+MAX_QUERY_HISTORY = 50
+
+
+@st.cache_resource
+def get_adapter() -> HTTPAdapter:
+    """Shared connection pool so API calls reuse keep-alive connections"""
+    return HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.1)
+    )
+
+
+def get_session() -> requests.Session:
+    """Per-user HTTP session on top of the shared connection pool"""
+    # Each browser session keeps its own cookies and headers; only the
+    # pooled adapter is shared across users
+    if 'http_session' not in st.session_state:
+        session = requests.Session()
+        adapter = get_adapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        st.session_state.http_session = session
+    return st.session_state.http_session
+
+
+def widget_key(prefix: str, text: str) -> str:
+    """Stable widget key derived from the text a widget represents"""
+    return f"{prefix}_{hashlib.blake2b(text.encode(), digest_size=6).hexdigest()}"
+
+
 # Initialize session state
 if 'queries' not in st.session_state:
-    st.session_state.queries = []
+    # (widget key, query) pairs; the key is hashed once when a query is added
+    st.session_state.queries = deque(maxlen=MAX_QUERY_HISTORY)
 if 'current_execution' not in st.session_state:
     st.session_state.current_execution = None
 
@@ -61,8 +98,10 @@ def main():
 
         # Query history
         st.subheader("📝 Recent Queries")
-        for i, query in enumerate(st.session_state.queries[-5:]):
-            if st.button(f"Query {i + 1}: {query[:30]}...", key=f"history_{i}"):
+        history = st.session_state.queries
+        recent = islice(history, max(len(history) - 5, 0), None)
+        for i, (key, query) in enumerate(recent):
+            if st.button(f"Query {i + 1}: {query[:30]}...", key=key):
                 st.session_state.current_query = query
 
     # Main content area
@@ -103,7 +142,7 @@ def main():
                 response = process_query(query_input, location_input)
                 if response:
                     st.session_state.current_response = response
-                    st.session_state.queries.append(query_input)
+                    add_to_history(query_input)
                     st.success("Query processed successfully!")
                     st.rerun()
 
@@ -139,7 +178,7 @@ def main():
             col_overview1, col_overview2, col_overview3 = st.columns(3)
 
             with col_overview1:
-                st.metric("Steps", len(workflow.get('steps', [])))
+                st.metric("Steps", len(workflow.get('step_ids', [])))
 
             with col_overview2:
                 st.metric("Tools", len(workflow.get('tools', [])))
@@ -150,17 +189,23 @@ def main():
             # Workflow steps
             st.subheader("📝 Execution Steps")
 
-            for step in workflow.get('steps', []):
-                with st.expander(f"Step {step['step']}: {step['action']}", expanded=False):
+            steps = zip(
+                workflow.get('step_ids', []),
+                workflow.get('actions', []),
+                workflow.get('step_tools', []),
+                workflow.get('params', [])
+            )
+            for step_id, action, tool, parameters in steps:
+                with st.expander(f"Step {step_id}: {action}", expanded=False):
                     col_step1, col_step2 = st.columns(2)
 
                     with col_step1:
-                        st.write(f"**Tool:** {step['tool']}")
-                        st.write(f"**Action:** {step['action']}")
+                        st.write(f"**Tool:** {tool}")
+                        st.write(f"**Action:** {action}")
 
                     with col_step2:
                         st.write("**Parameters:**")
-                        st.json(step.get('parameters', {}))
+                        st.json(parameters)
 
             # Execute workflow
             if st.button("🚀 Execute Complete Workflow", type="primary"):
@@ -175,61 +220,57 @@ def main():
             st.info("Enter a query in the left panel to generate a workflow.")
 
     # Execution monitoring
+    execution_id = None
     if 'current_execution' in st.session_state and st.session_state.current_execution:
         st.header("⚙️ Execution Monitor")
 
         execution_id = st.session_state.current_execution['execution_id']
 
-        # Auto-refresh execution status
-        status_placeholder = st.empty()
-        progress_placeholder = st.empty()
+        # Placeholders are filled in place by monitor_execution below
+        col_status1, col_status2 = st.columns(2)
 
-        with status_placeholder.container():
-            status = get_execution_status(execution_id)
-            if status:
-                col_status1, col_status2 = st.columns(2)
+        with col_status1:
+            status_placeholder = st.empty()
 
-                with col_status1:
-                    st.write(f"**Status:** {status['status'].title()}")
+        with col_status2:
+            progress_placeholder = st.empty()
 
-                with col_status2:
-                    if 'progress' in status:
-                        progress_placeholder.progress(status['progress'] / 100)
-
-                # Show results if completed
-                if status['status'] == 'completed' and 'results' in status:
-                    show_results(status['results'])
-
-                # Auto-refresh if still executing
-                if status['status'] == 'executing':
-                    time.sleep(2)
-                    st.rerun()
+        results_container = st.container()
 
     # Map visualization area
     st.header("🗺️ Interactive Map")
 
-    # Create default map
-    m = folium.Map(
-        location=[20.5937, 78.9629],  # Center of India
-        zoom_start=5,
-        tiles="OpenStreetMap"
-    )
-
     # Add sample markers (replace with actual results)
+    markers = ()
     if 'current_execution' in st.session_state:
         # Add result markers to map
-        sample_locations = [
-            [19.0760, 72.8777, "Mumbai School"],
-            [19.0896, 72.8656, "Mumbai Hospital"],
-            [28.6139, 77.2090, "Delhi School"]
-        ]
+        markers = (
+            (19.0760, 72.8777, "Mumbai School"),
+            (19.0896, 72.8656, "Mumbai Hospital"),
+            (28.6139, 77.2090, "Delhi School")
+        )
 
-        for lat, lon, name in sample_locations:
-            folium.Marker([lat, lon], popup=name).add_to(m)
+    # Reruns reuse the cached map for the same markers
+    m = build_map(markers)
 
     # Display map
+    from streamlit_folium import st_folium
     map_data = st_folium(m, width=700, height=400)
 
+    # Poll last, once the rest of the page has been rendered
+    if execution_id:
+        monitor_execution(execution_id, status_placeholder, progress_placeholder, results_container)
+
+
+def add_to_history(query: str):
+    """Record a query as the most recent history entry"""
+    entry = (widget_key("history", query), query)
+
+    # Widget keys must be unique, so a repeated query moves to the end
+    if entry in st.session_state.queries:
+        st.session_state.queries.remove(entry)
+    st.session_state.queries.append(entry)
+
 
 def process_query(query: str, location: str = None) -> Dict:
     """Process query via API"""
@@ -240,7 +281,7 @@ def process_query(query: str, location: str = None) -> Dict:
             "execute_immediately": False
         }
 
-        response = requests.post(f"{API_BASE_URL}/api/query", json=payload)
+        response = get_session().post(f"{API_BASE_URL}/api/query", json=payload)
 
         if response.status_code == 200:
             return response.json()
@@ -264,7 +305,7 @@ def execute_workflow(query_id: str, workflow: Dict) -> Dict:
             "workflow": workflow
         }
 
-        response = requests.post(f"{API_BASE_URL}/api/execute", json=payload)
+        response = get_session().post(f"{API_BASE_URL}/api/execute", json=payload)
 
         if response.status_code == 200:
             return response.json()
@@ -280,7 +321,7 @@ def execute_workflow(query_id: str, workflow: Dict) -> Dict:
 def get_execution_status(execution_id: str) -> Dict:
     """Get execution status via API"""
     try:
-        response = requests.get(f"{API_BASE_URL}/api/status/{execution_id}")
+        response = get_session().get(f"{API_BASE_URL}/api/status/{execution_id}")
 
         if response.status_code == 200:
             return response.json()
@@ -292,6 +333,46 @@ def get_execution_status(execution_id: str) -> Dict:
         return None
 
 
+@st.cache_resource
+def build_map(markers: tuple):
+    """Build the results map once per marker set instead of on every rerun"""
+    import folium
+
+    m = folium.Map(
+        location=[20.5937, 78.9629],  # Center of India
+        zoom_start=5,
+        tiles="OpenStreetMap"
+    )
+
+    for lat, lon, name in markers:
+        folium.Marker([lat, lon], popup=name).add_to(m)
+
+    return m
+
+
+def monitor_execution(execution_id: str, status_placeholder, progress_placeholder, results_container):
+    """Poll execution status, updating only the monitor widgets until it finishes"""
+    while True:
+        status = get_execution_status(execution_id)
+        if not status:
+            return
+
+        status_placeholder.write(f"**Status:** {status['status'].title()}")
+        if 'progress' in status:
+            progress_placeholder.progress(status['progress'] / 100)
+
+        if status['status'] != 'executing':
+            break
+
+        # Refresh in place instead of rerunning the whole script
+        time.sleep(STATUS_POLL_INTERVAL)
+
+    # Show results if completed
+    if status['status'] == 'completed' and 'results' in status:
+        with results_container:
+            show_results(status['results'])
+
+
 def show_results(results: Dict):
     """Display execution results"""
     st.subheader("📊 Execution Results")
@@ -347,7 +428,7 @@ example_queries = [
 ]
 
 for i, example in enumerate(example_queries):
-    if st.sidebar.button(f"📝 Use Example {i + 1}", key=f"example_{i}"):
+    if st.sidebar.button(f"📝 Use Example {i + 1}", key=widget_key("example", example)):
         st.session_state.current_query = example
         st.rerun()
 
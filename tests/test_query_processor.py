@@ -0,0 +1,278 @@
+"""
+Tests for the GIS query processor: matching backends, workflow cache and batcher
+"""
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "ai"))
+
+import query_processor  # noqa: E402
+
+QUERIES = [
+    "Find all schools within 1km of hospitals in Mumbai",
+    "find all schools WITHIN 1KM of Hospitals in mumbai",
+    "Identify flood-prone areas within 5 miles of rivers",
+    "Calculate population density within 2.5 km of roads in Delhi",
+    "Count PARKS around Bangalore",
+    "Buffer the Buildings near Chennai and Kolkata",
+    "Show forests that intersect cities in İndia",
+    "Classify land use in Straße",
+    "within 1km",
+    "1km",
+    "within10m of a village",
+    "",
+]
+
+BACKENDS = ["hyperscan", "ahocorasick", "re"]
+
+
+@pytest.fixture
+def make_processor(monkeypatch):
+    """Build a processor that only uses the given matching backend"""
+    def make(backend: str) -> query_processor.GISQueryProcessor:
+        if backend == "hyperscan" and query_processor.hyperscan is None:
+            pytest.skip("hyperscan is not installed")
+        if backend == "ahocorasick" and query_processor.ahocorasick is None:
+            pytest.skip("pyahocorasick is not installed")
+
+        if backend != "hyperscan":
+            monkeypatch.setattr(query_processor, "hyperscan", None)
+        if backend == "re":
+            monkeypatch.setattr(query_processor, "ahocorasick", None)
+
+        processor = query_processor.GISQueryProcessor()
+        assert (processor._hs_db is not None) == (backend == "hyperscan")
+        assert (processor._automaton is not None) == (backend == "ahocorasick")
+        return processor
+
+    return make
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backend_matches_regex_fallback(make_processor, backend):
+    # The backend under test is built first, before the fallback
+    # disables the optional matchers
+    processor = make_processor(backend)
+    reference = make_processor("re")
+
+    for query in QUERIES:
+        assert processor.parse_query(query) == reference.parse_query(query), query
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_overlapping_distance_and_operation(make_processor, backend):
+    parsed = make_processor(backend).parse_query("Find all SCHOOLS Within 1KM of hospitals in MUMBAI")
+
+    assert parsed["spatial_operation"] == query_processor.PATTERNS["spatial_operations"][0]
+    assert parsed["parameters"] == {"distance": "1", "unit": "km"}
+    assert parsed["target_objects"] == ["school", "hospital"]
+    assert parsed["location"] == "MUMBAI"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_location_keeps_original_text(make_processor, backend):
+    processor = make_processor(backend)
+
+    assert processor.parse_query("Parks in İndia")["location"] == "İndia"
+    assert processor.parse_query("Straße near Mumbai")["location"] == "Mumbai"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Semantic cache whose embeddings all match, so only the key decides a hit"""
+    import numpy as np
+
+    cache = query_processor.SemanticWorkflowCache(max_entries=2)
+    cache.enabled = True
+    monkeypatch.setattr(cache, "_encode", lambda text: np.array([1.0, 0.0], dtype=np.float32))
+    return cache
+
+
+@pytest.fixture
+def parse(make_processor):
+    return make_processor("re").parse_query
+
+
+def make_generate(calls):
+    """Workflow generator stub that records the queries it was called for"""
+    def generate(parsed_query):
+        calls.append(parsed_query['original_query'])
+        return {'query': parsed_query['original_query']}
+
+    return generate
+
+
+def test_cache_hit_for_paraphrase(cache, parse):
+    calls = []
+    first = cache.get_or_generate(parse("Find schools near hospitals in Mumbai"), make_generate(calls))
+    second = cache.get_or_generate(parse("schools close to hospitals in mumbai"), make_generate(calls))
+
+    assert calls == ["Find schools near hospitals in Mumbai"]
+    assert second == first
+    assert second is not first
+
+
+@pytest.mark.parametrize("other", [
+    "Find schools near hospitals in Delhi",
+    "Count schools near hospitals in Mumbai",
+    "Schools that intersect hospitals in Mumbai",
+])
+def test_cache_miss_on_different_field(cache, parse, other):
+    calls = []
+    cache.get_or_generate(parse("Find schools near hospitals in Mumbai"), make_generate(calls))
+    workflow = cache.get_or_generate(parse(other), make_generate(calls))
+
+    assert calls == ["Find schools near hospitals in Mumbai", other]
+    assert workflow == {'query': other}
+
+
+def test_cache_evicts_oldest_entry(cache, parse):
+    calls = []
+    queries = ["Schools in Mumbai", "Schools in Delhi", "Schools in Chennai"]
+    for query in queries:
+        cache.get_or_generate(parse(query), make_generate(calls))
+
+    assert len(cache._entries) == len(cache._embeddings) == 2
+
+    cache.get_or_generate(parse("Schools in Chennai"), make_generate(calls))
+    cache.get_or_generate(parse("Schools in Mumbai"), make_generate(calls))
+    assert calls == queries + ["Schools in Mumbai"]
+
+
+def test_cache_skips_failed_generation(cache, parse):
+    def fail(parsed_query):
+        raise RuntimeError("generation failed")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_generate(parse("Schools in Mumbai"), fail)
+
+    assert cache._entries == []
+    assert cache._embeddings is None
+
+
+def submit_all(batcher, requests):
+    """Submit requests from one thread each and collect results in request order"""
+    results = [None] * len(requests)
+
+    def submit(index):
+        try:
+            results[index] = batcher.submit(requests[index])
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=submit, args=(index,)) for index in range(len(requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    return results
+
+
+def test_batcher_returns_each_callers_result():
+    batches = []
+
+    def generate_batch(batch):
+        batches.append(batch)
+        return [f"completion for {request}" for request in batch]
+
+    batcher = query_processor.GenerationBatcher(generate_batch, max_batch=4, max_wait=0.5)
+    requests = [f"prompt {index}" for index in range(10)]
+
+    assert submit_all(batcher, requests) == [f"completion for {request}" for request in requests]
+    assert sorted(request for batch in batches for request in batch) == sorted(requests)
+
+
+def test_batcher_limits_batch_size():
+    batches = []
+
+    def generate_batch(batch):
+        batches.append(batch)
+        time.sleep(0.01)
+        return list(batch)
+
+    batcher = query_processor.GenerationBatcher(generate_batch, max_batch=3, max_wait=0.5)
+    submit_all(batcher, list(range(10)))
+
+    assert max(len(batch) for batch in batches) == 3
+    assert sum(len(batch) for batch in batches) == 10
+
+
+def test_batcher_fails_every_request_in_batch():
+    batches = []
+
+    def generate_batch(batch):
+        batches.append(batch)
+        raise RuntimeError("generation failed")
+
+    batcher = query_processor.GenerationBatcher(generate_batch, max_batch=5, max_wait=1)
+    results = submit_all(batcher, list(range(5)))
+
+    assert len(batches) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_batcher_fails_short_result():
+    batcher = query_processor.GenerationBatcher(lambda batch: batch[:-1], max_batch=2, max_wait=1)
+    results = submit_all(batcher, ["a", "b"])
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_batcher_streams_alone_between_batches():
+    active, overlaps, calls = [0], [], []
+
+    def run(kind, prompts):
+        active[0] += 1
+        overlaps.append(active[0] > 1)
+        calls.append((kind, prompts))
+        time.sleep(0.01)
+        active[0] -= 1
+
+    def generate_batch(batch):
+        run("batch", batch)
+        return [prompt.upper() for prompt in batch]
+
+    def generate_stream(prompt, start):
+        chunks = queue.Queue()
+        start(iter(chunks.get, None))
+        run("stream", [prompt])
+        for word in prompt.split():
+            chunks.put(word)
+        chunks.put(None)
+
+    batcher = query_processor.GenerationBatcher(generate_batch, generate_stream, max_batch=4, max_wait=0.05)
+    streamed = []
+    stream_thread = threading.Thread(target=lambda: streamed.extend(batcher.stream("stream these words")))
+    stream_thread.start()
+    results = submit_all(batcher, [f"prompt {index}" for index in range(6)])
+    stream_thread.join(timeout=5)
+
+    assert streamed == ["stream", "these", "words"]
+    assert results == [f"PROMPT {index}" for index in range(6)]
+    assert ("stream", ["stream these words"]) in calls
+    assert not any(overlaps)
+
+
+def test_batcher_stream_raises_generation_error():
+    def generate_stream(prompt, start):
+        start(iter(["partial"]))
+        raise RuntimeError("generation failed")
+
+    batcher = query_processor.GenerationBatcher(lambda batch: batch, generate_stream)
+    streamed = []
+
+    with pytest.raises(RuntimeError):
+        for chunk in batcher.stream("prompt"):
+            streamed.append(chunk)
+    assert streamed == ["partial"]
+
+
+def test_batcher_stream_without_stream_support():
+    batcher = query_processor.GenerationBatcher(lambda batch: [prompt.upper() for prompt in batch])
+
+    assert list(batcher.stream("prompt")) == ["PROMPT"]